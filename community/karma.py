@@ -0,0 +1,167 @@
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.core.cache import cache
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    close_old_connections,
+    transaction,
+)
+
+from .models import KarmaTransaction
+
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_CACHE_KEY = "leaderboard:24h:v1"
+LEADERBOARD_CACHE_TTL = 60  # seconds
+
+
+class KarmaQueue:
+    """
+    Buffer KarmaTransaction rows and write them in batches off the request path.
+
+    Like views call `put()`; a daemon thread flushes the buffer with one
+    `bulk_create` every `flush_interval` seconds, or as soon as
+    `batch_size` rows are waiting. The like rows themselves are still
+    written synchronously, so likes stay idempotent; only the ledger entry
+    is deferred. Pending rows are flushed at interpreter exit.
+
+    A failed batch is retried row by row, so one bad row cannot hold back
+    the others. A row whose post or comment was deleted in the meantime is
+    kept without that reference, like any ledger row of a deleted target
+    (the FKs are SET_NULL); only rows whose user is gone are dropped. Rows
+    hitting other database errors are retried on the next flush, at most
+    `max_attempts` times, then logged and dropped. When `max_pending` rows
+    are waiting, `put()` flushes in the caller's thread instead of growing
+    the queue without bound.
+
+    Rows still buffered when the process is killed (SIGKILL, a worker
+    timeout) are lost, so the ledger is best-effort; see EXPLAINER 2.1.
+    """
+
+    def __init__(
+        self, batch_size=500, flush_interval=1.0, max_pending=10_000, max_attempts=5
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # (row, failed attempts so far)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def put(self, row):
+        if len(self._pending) >= self.max_pending:
+            # Back-pressure: write the backlog now rather than drop rows
+            logger.warning("Karma queue is full; flushing in the caller")
+            self.flush()
+        self._pending.append((row, 0))
+        self._ensure_worker()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write every pending row now; returns how many were written.
+        """
+        with self._lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    KarmaTransaction.objects.bulk_create(
+                        [row for row, _ in batch], batch_size=self.batch_size
+                    )
+                written = len(batch)
+            except DatabaseError:
+                logger.warning(
+                    "Bulk insert of %d karma transactions failed; "
+                    "retrying one by one",
+                    len(batch),
+                    exc_info=True,
+                )
+                written = self._write_each(batch)
+        if written:
+            # bulk_create() sends no post_save, so invalidate here
+            cache.delete(LEADERBOARD_CACHE_KEY)
+        return written
+
+    def _write_each(self, batch):
+        written = 0
+        for row, attempts in batch:
+            # The rolled back batch may have assigned primary keys
+            row.pk = None
+            try:
+                try:
+                    self._insert(row)
+                except IntegrityError:
+                    if not self._detach_deleted_targets(row):
+                        raise
+                    self._insert(row)
+            except IntegrityError:
+                # Only the user FK is left; its karma went with the user
+                logger.exception("Dropping karma transaction %r", row)
+            except DatabaseError:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.exception(
+                        "Dropping karma transaction %r after %d attempts",
+                        row,
+                        attempts,
+                    )
+                else:
+                    self._pending.append((row, attempts))
+            else:
+                written += 1
+        return written
+
+    def _insert(self, row):
+        with transaction.atomic():
+            KarmaTransaction.objects.bulk_create([row])
+
+    def _detach_deleted_targets(self, row):
+        # Keep the karma of a post/comment deleted since the like, as
+        # on_delete=SET_NULL does for rows that were already written.
+        detached = False
+        for field in ("post", "comment"):
+            target_id = getattr(row, f"{field}_id")
+            if target_id is None:
+                continue
+            model = KarmaTransaction._meta.get_field(field).related_model
+            if not model.objects.filter(pk=target_id).exists():
+                setattr(row, f"{field}_id", None)
+                detached = True
+        return detached
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, name="karma-queue", daemon=True
+                    )
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush karma transactions")
+            finally:
+                close_old_connections()
+
+
+karma_queue = KarmaQueue()
+atexit.register(karma_queue.flush)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-15 21:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counts(apps, schema_editor):
+    for model_name, like_model_name, fk in (
+        ("Post", "PostLike", "post"),
+        ("Comment", "CommentLike", "comment"),
+    ):
+        model = apps.get_model("community", model_name)
+        like_model = apps.get_model("community", like_model_name)
+        likes = (
+            like_model.objects.filter(**{fk: OuterRef("pk")})
+            .values(fk)
+            .annotate(c=Count("*"))
+            .values("c")
+        )
+        model.objects.update(
+            like_count=Coalesce(Subquery(likes, output_field=models.IntegerField()), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0002_karmatransaction_created_user_amount_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from collections import Counter
+
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr
 from django.utils import timezone
 
 
@@ -9,6 +13,8 @@ class Post(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized count of PostLike rows, maintained by PostLikeView
+    like_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ["-created_at"]
@@ -17,6 +23,121 @@ class Post(models.Model):
         return f"Post(id={self.id}, author={self.author})"
 
 
+def with_content_snippet(queryset, length):
+    """
+    Defer the `content` TEXT column and select only its first `length`
+    characters as `content_snippet`. Pair with apply_content_snippet().
+    """
+    return queryset.defer("content").annotate(
+        content_snippet=Substr("content", 1, length)
+    )
+
+
+def apply_content_snippet(objs):
+    for obj in objs:
+        obj.content = obj.content_snippet
+
+
+class CommentManager(models.Manager):
+    def tree_for_posts(self, post_ids, truncate=None):
+        """
+        Flat list of every comment of the given posts, ready for
+        build_comment_tree.
+
+        With `truncate`, only the first `truncate` characters of `content` are
+        read from the database.
+        """
+        return self._for_posts(post_ids, truncate)
+
+    def feed_for_posts(
+        self, post_ids, roots_per_post, comments_per_post, truncate=None
+    ):
+        """
+        Like `tree_for_posts`, but bounded for the post list: per post, the
+        oldest `roots_per_post` top-level comments with their replies, and at
+        most `comments_per_post` comments in total (oldest first), so one
+        huge thread cannot blow up the page.
+
+        Returns `(comments, post_ids_with_more)`; the second is the set of
+        posts that have comments beyond those bounds.
+        """
+        # One extra root and one extra row per post tell whether anything
+        # was left out, without a separate COUNT query.
+        ids = self._thread_ids(post_ids, roots_per_post + 1, comments_per_post + 1)
+        comments = self._for_posts(post_ids, truncate, ids=ids)
+        kept = []
+        kept_ids = set()
+        roots = Counter()
+        rows = Counter()
+        with_more = set()
+        for c in comments:
+            post_id = c.post_id
+            if c.parent_id is None:
+                fits = roots[post_id] < roots_per_post
+            else:
+                fits = c.parent_id in kept_ids
+            if fits and rows[post_id] < comments_per_post:
+                if c.parent_id is None:
+                    roots[post_id] += 1
+                rows[post_id] += 1
+                kept.append(c)
+                kept_ids.add(c.id)
+            else:
+                with_more.add(post_id)
+        return kept, with_more
+
+    def _for_posts(self, post_ids, truncate, ids=None):
+        qs = (
+            self.get_queryset()
+            .filter(post_id__in=post_ids)
+            .select_related("author")
+        )
+        if ids is not None:
+            qs = qs.filter(pk__in=ids)
+        if truncate is not None:
+            qs = with_content_snippet(qs, truncate)
+        comments = list(qs.order_by("created_at", "id"))
+        if truncate is not None:
+            apply_content_snippet(comments)
+        return comments
+
+    def _thread_ids(self, post_ids, roots_per_post, comments_per_post):
+        # Subquery: the first `roots_per_post` roots of each post with all of
+        # their descendants (WITH RECURSIVE), cut to the oldest
+        # `comments_per_post` rows per post. Replies are newer than their
+        # parent, so the cut never keeps a reply without its parent.
+        post_ids = list(post_ids)
+        if not post_ids:
+            return []
+        qn = connections[self.db].ops.quote_name
+        meta = self.model._meta
+        table = qn(meta.db_table)
+        pk = qn(meta.pk.column)
+        post = qn(meta.get_field("post").column)
+        parent = qn(meta.get_field("parent").column)
+        created_at = qn(meta.get_field("created_at").column)
+        placeholders = ", ".join(["%s"] * len(post_ids))
+        sql = (
+            f"WITH RECURSIVE ranked AS ("
+            f"SELECT {pk}, {post}, {created_at}, ROW_NUMBER() OVER ("
+            f"PARTITION BY {post} ORDER BY {created_at}, {pk}) AS rn "
+            f"FROM {table} "
+            f"WHERE {parent} IS NULL AND {post} IN ({placeholders})"
+            f"), thread AS ("
+            f"SELECT {pk}, {post}, {created_at} FROM ranked WHERE rn <= %s "
+            f"UNION ALL "
+            f"SELECT c.{pk}, c.{post}, c.{created_at} FROM {table} c "
+            f"INNER JOIN thread t ON c.{parent} = t.{pk}"
+            f"), capped AS ("
+            f"SELECT {pk}, ROW_NUMBER() OVER ("
+            f"PARTITION BY {post} ORDER BY {created_at}, {pk}) AS rn "
+            f"FROM thread"
+            f") "
+            f"SELECT {pk} FROM capped WHERE rn <= %s"
+        )
+        return RawSQL(sql, [*post_ids, roots_per_post, comments_per_post])
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, related_name="comments"
@@ -33,9 +154,19 @@ class Comment(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized count of CommentLike rows, maintained by CommentLikeView
+    like_count = models.PositiveIntegerField(default=0)
+
+    objects = CommentManager()
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # tree_for_posts: filter by post and number/order by created_at
+            models.Index(
+                fields=["post", "created_at"], name="comment_post_created_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Comment(id={self.id}, post_id={self.post_id}, author={self.author})"
@@ -62,7 +193,7 @@ class KarmaTransaction(models.Model):
     )
     amount = models.IntegerField()
     reason = models.CharField(max_length=32, choices=REASONS)
-    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
 
     # Optional denormalized references for debugging / introspection
     post = models.ForeignKey(
@@ -74,11 +205,130 @@ class KarmaTransaction(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Leaderboard: covers the 24h range filter, the per-user grouping
+            # and the summed amount, so the window is an index-only scan.
+            models.Index(
+                fields=["created_at", "user", "amount"],
+                name="kt_created_user_amount_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"KarmaTransaction(user={self.user_id}, amount={self.amount}, reason={self.reason})"
 
 
+class LikeManager(models.Manager):
+    """
+    Manager for the like models, keyed by the liked object's FK name.
+    """
+
+    def __init__(self, target_field):
+        super().__init__()
+        self.target_field = target_field
+
+    def _write_connection(self):
+        # Raw SQL bypasses the queryset, so route it like a write ourselves
+        return connections[self._db or router.db_for_write(self.model)]
+
+    def create_if_absent(self, user, target_id):
+        """
+        Insert a like unless `user` already liked the target with primary key
+        `target_id`; return whether a row was created.
+
+        Uses a single `INSERT ... ON CONFLICT DO NOTHING RETURNING id`
+        (PostgreSQL, SQLite >= 3.35) instead of get_or_create's SELECT +
+        savepoint + INSERT.
+        """
+        connection = self._write_connection()
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        user_column = meta.get_field("user").column
+        target_column = meta.get_field(self.target_field).column
+        created_column = meta.get_field("created_at").column
+        sql = (
+            f"INSERT INTO {qn(meta.db_table)} "
+            f"({qn(user_column)}, {qn(target_column)}, {qn(created_column)}) "
+            f"VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({qn(user_column)}, {qn(target_column)}) DO NOTHING "
+            f"RETURNING {qn(meta.pk.column)}"
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, target_id, now])
+            return cursor.fetchone() is not None
+
+    def supports_writable_cte(self):
+        # Data-modifying statements inside WITH are PostgreSQL-only
+        return self._write_connection().vendor == "postgresql"
+
+    def create_with_karma(self, user, target_id, amount, reason):
+        """
+        Like `create_if_absent`, but in the same statement also bump the
+        target's `like_count` and credit `amount` karma to its author.
+
+        One round trip: the UPDATE and the KarmaTransaction INSERT only see a
+        row when the like was new, so there is no Python-level branching and
+        no need to load the target first. Returns whether the like was new.
+        Raises the target model's DoesNotExist for an unknown `target_id`.
+        Requires `supports_writable_cte()`.
+
+        The like is inserted from a SELECT on the target rather than left to
+        its FK, whose check is deferred to COMMIT and so would fire outside
+        the caller's control inside an enclosing atomic().
+        """
+        connection = self._write_connection()
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        user_column = meta.get_field("user").column
+        target_field = meta.get_field(self.target_field)
+        target_column = target_field.column
+        target_model = target_field.related_model
+        target_meta = target_model._meta
+        target_table = qn(target_meta.db_table)
+        target_pk = qn(target_meta.pk.column)
+        author_column = qn(target_meta.get_field("author").column)
+        like_count = qn(target_meta.get_field("like_count").column)
+        karma_meta = KarmaTransaction._meta
+        karma_columns = ", ".join(
+            qn(karma_meta.get_field(name).column)
+            for name in ("user", "amount", "reason", "created_at", self.target_field)
+        )
+        sql = (
+            f"WITH new_like AS ("
+            f"INSERT INTO {qn(meta.db_table)} "
+            f"({qn(user_column)}, {qn(target_column)}, "
+            f"{qn(meta.get_field('created_at').column)}) "
+            f"SELECT %s, {target_pk}, %s FROM {target_table} "
+            f"WHERE {target_pk} = %s "
+            f"ON CONFLICT ({qn(user_column)}, {qn(target_column)}) DO NOTHING "
+            f"RETURNING {qn(target_column)}"
+            f"), liked AS ("
+            f"UPDATE {target_table} "
+            f"SET {like_count} = {like_count} + 1 "
+            f"WHERE {target_pk} IN (SELECT {qn(target_column)} FROM new_like) "
+            f"RETURNING {target_pk}, {author_column}"
+            f"), karma AS ("
+            f"INSERT INTO {qn(karma_meta.db_table)} ({karma_columns}) "
+            f"SELECT {author_column}, %s, %s, %s, {target_pk} FROM liked "
+            f"RETURNING {qn(karma_meta.pk.column)}"
+            f") "
+            f"SELECT EXISTS (SELECT 1 FROM {target_table} WHERE {target_pk} = %s), "
+            f"EXISTS (SELECT 1 FROM karma)"
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql, [user.pk, now, target_id, amount, reason, now, target_id]
+            )
+            found, created = cursor.fetchone()
+        if not found:
+            raise target_model.DoesNotExist(
+                f"{target_meta.object_name} matching query does not exist."
+            )
+        return created
+
+
 class PostLike(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -90,6 +340,8 @@ class PostLike(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LikeManager("post")
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -113,6 +365,8 @@ class CommentLike(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LikeManager("comment")
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
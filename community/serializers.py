@@ -1,4 +1,7 @@
+from copy import copy, deepcopy
+
 from django.contrib.auth import get_user_model
+from django.db import models
 from rest_framework import serializers
 
 from .models import Post, Comment
@@ -7,19 +10,103 @@ from .models import Post, Comment
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class CachedFieldsMixin:
+    """
+    Build a serializer class's fields once and hand out copies.
+
+    ModelSerializer.get_fields() deep-copies the declared fields and
+    introspects the model on every instantiation, which adds up when the
+    serializers are created per comment. The cached fields are never bound,
+    so each copy is bound to its own serializer by DRF as usual.
+    """
+
+    _field_cache = {}
+
+    def get_fields(self):
+        cls = type(self)
+        fields = self._field_cache.get(cls)
+        if fields is None:
+            fields = self._field_cache[cls] = super().get_fields()
+        # Nested serializers hold fields of their own (a ListSerializer's
+        # `child` is bound to it), so a shallow copy would share them.
+        return {
+            name: (
+                deepcopy(field)
+                if isinstance(field, serializers.BaseSerializer)
+                else copy(field)
+            )
+            for name, field in fields.items()
+        }
+
+
+class UserSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username"]
 
 
-class CommentSerializer(serializers.ModelSerializer):
-    author = UserSerializer(read_only=True)
-    replies = serializers.SerializerMethodField()
+class AuthorField(serializers.Field):
+    """
+    Read-only `author` representation.
+
+    Views put a per-request `{user_id: {...}}` map in `context["user_map"]` so
+    each author is serialized once rather than once per post/comment.
+    Authors missing from the map fall back to UserSerializer.
+    """
+
+    # Reads the `author` relation; see views.related_lookups
+    select_related = True
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, instance):
+        data = self.context.get("user_map", {}).get(instance.author_id)
+        if data is None:
+            data = UserSerializer(instance.author).data
+        return data
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    """
+    Render root comments together with their in-memory replies.
+
+    Walks `_prefetched_replies` (see build_comment_tree) with an explicit
+    stack, attaching each child's dict to its parent's `replies`, so a whole
+    thread is rendered by this one serializer without recursion.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        render = self.child.to_representation
+
+        ret = []
+        stack = [(c, ret) for c in reversed(iterable)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            c, siblings = pop()
+            item = render(c)
+            siblings.append(item)
+            # Comments that did not go through build_comment_tree have no
+            # in-memory replies; render them without a thread.
+            replies = item["replies"]
+            for r in reversed(getattr(c, "_prefetched_replies", ())):
+                push((r, replies))
+        return ret
+
+
+class CommentSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    author = AuthorField()
     like_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Comment
+        list_serializer_class = CommentListSerializer
         fields = [
             "id",
             "post",
@@ -28,35 +115,56 @@ class CommentSerializer(serializers.ModelSerializer):
             "content",
             "created_at",
             "like_count",
-            "replies",
         ]
-        read_only_fields = ["post", "author", "created_at", "like_count", "replies"]
+        read_only_fields = ["post", "author", "created_at", "like_count"]
 
-    def get_replies(self, obj):
-        children = getattr(obj, "_prefetched_replies", [])
-        serializer = CommentSerializer(children, many=True, context=self.context)
-        return serializer.data
+    def to_representation(self, instance):
+        # CommentListSerializer fills `replies` in while walking a thread;
+        # a standalone comment has none.
+        data = super().to_representation(instance)
+        data["replies"] = []
+        return data
 
 
-class PostSerializer(serializers.ModelSerializer):
-    author = UserSerializer(read_only=True)
+class PostSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    author = AuthorField()
     comments = serializers.SerializerMethodField()
+    has_more_comments = serializers.SerializerMethodField()
     like_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ["id", "author", "content", "created_at", "like_count", "comments"]
-        read_only_fields = ["author", "created_at", "like_count", "comments"]
+        fields = [
+            "id",
+            "author",
+            "content",
+            "created_at",
+            "like_count",
+            "comments",
+            "has_more_comments",
+        ]
+        read_only_fields = [
+            "author",
+            "created_at",
+            "like_count",
+            "comments",
+            "has_more_comments",
+        ]
 
     def get_comments(self, obj):
-        # Expect the view to inject a prefetched flat list for this post
-        comment_tree = self.context.get("comment_tree", {}).get(obj.id, [])
-        serializer = CommentSerializer(comment_tree, many=True, context=self.context)
-        return serializer.data
-
-
-class LeaderboardEntrySerializer(serializers.Serializer):
-    user = UserSerializer()
-    karma_24h = serializers.IntegerField()
-
-
+        # Expect the view to inject the in-memory comment tree roots per post
+        roots = self.context.get("comment_tree", {}).get(obj.id, [])
+        return self._get_comments_serializer().to_representation(roots)
+
+    def get_has_more_comments(self, obj):
+        # True when `comments` only holds the first threads of the post
+        return obj.id in self.context.get("posts_with_more_comments", ())
+
+    def _get_comments_serializer(self):
+        # One CommentListSerializer renders the comments of every post
+        serializer = getattr(self, "_comments_serializer", None)
+        if serializer is None:
+            serializer = self._comments_serializer = CommentSerializer(
+                many=True, context=self.context
+            )
+        return serializer
@@ -0,0 +1,15 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .karma import LEADERBOARD_CACHE_KEY
+from .models import KarmaTransaction
+
+
+@receiver(post_save, sender=KarmaTransaction)
+def invalidate_leaderboard(sender, instance, created, **kwargs):
+    # Only covers rows saved one at a time (admin, shell, fixtures). Likes
+    # write karma with bulk_create or raw SQL, which send no post_save, so
+    # karma_queue.flush() and record_like() invalidate the cache themselves.
+    if created:
+        cache.delete(LEADERBOARD_CACHE_KEY)
@@ -1,3 +1,335 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework import serializers
+
+from .karma import LEADERBOARD_CACHE_KEY, KarmaQueue
+from .models import Comment, CommentLike, KarmaTransaction, Post, PostLike
+from .serializers import CachedFieldsMixin
+from .views import PostListCreateView, record_like
+
+
+User = get_user_model()
+
+
+class CachedFieldsMixinTests(SimpleTestCase):
+    def test_nested_serializers_see_the_callers_context(self):
+        class Item(serializers.Serializer):
+            value = serializers.SerializerMethodField()
+
+            def get_value(self, obj):
+                return self.context.get("value")
+
+        class Items(CachedFieldsMixin, serializers.Serializer):
+            items = Item(many=True)
+
+        for value in ("first", "second"):
+            data = Items({"items": [{}]}, context={"value": value}).data
+            self.assertEqual(data["items"], [{"value": value}])
+
+
+class PostCommentsTests(TestCase):
+    def setUp(self):
+        author = User.objects.create(username="author")
+        self.post = Post.objects.create(author=author, content="hello")
+
+        def comment(parent=None):
+            return Comment.objects.create(
+                post=self.post, author=author, content="hi", parent=parent
+            )
+
+        self.first = comment()
+        self.reply = comment(parent=self.first)
+        self.second = comment()
+        self.nested = comment(parent=self.reply)
+
+    def test_list_limits_threads_not_replies(self):
+        with mock.patch.object(PostListCreateView, "comment_roots_per_post", 1):
+            [post] = self.client.get("/api/posts/").json()
+
+        self.assertTrue(post["has_more_comments"])
+        [root] = post["comments"]
+        self.assertEqual(root["id"], self.first.id)
+        [reply] = root["replies"]
+        self.assertEqual(reply["id"], self.reply.id)
+        self.assertEqual([r["id"] for r in reply["replies"]], [self.nested.id])
+
+    def test_list_bounds_comments_per_post(self):
+        with mock.patch.object(PostListCreateView, "comments_per_post", 2):
+            [post] = self.client.get("/api/posts/").json()
+
+        self.assertTrue(post["has_more_comments"])
+        [root] = post["comments"]
+        self.assertEqual(root["id"], self.first.id)
+        [reply] = root["replies"]
+        self.assertEqual((reply["id"], reply["replies"]), (self.reply.id, []))
+
+    def test_list_exactly_at_the_bounds(self):
+        with mock.patch.multiple(
+            PostListCreateView, comment_roots_per_post=2, comments_per_post=4
+        ):
+            [post] = self.client.get("/api/posts/").json()
+
+        self.assertFalse(post["has_more_comments"])
+        self.assertEqual(len(post["comments"]), 2)
+
+    def test_list_without_more_threads(self):
+        [post] = self.client.get("/api/posts/").json()
+
+        self.assertFalse(post["has_more_comments"])
+        self.assertEqual(
+            [c["id"] for c in post["comments"]], [self.first.id, self.second.id]
+        )
+
+    def test_truncate(self):
+        [post] = self.client.get("/api/posts/?truncate=1").json()
+
+        self.assertEqual(post["content"], "h")
+        self.assertEqual({c["content"] for c in post["comments"]}, {"h"})
+
+    def test_invalid_truncate(self):
+        for value in ("0", "abc"):
+            response = self.client.get(f"/api/posts/?truncate={value}")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("truncate", response.json())
+
+    def test_create_ignores_truncate(self):
+        response = self.client.post(
+            "/api/posts/?truncate=abc",
+            {"content": "new"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["content"], "new")
+
+    def test_detail_returns_every_thread(self):
+        post = self.client.get(f"/api/posts/{self.post.id}/").json()
+
+        self.assertFalse(post["has_more_comments"])
+        self.assertEqual(
+            [c["id"] for c in post["comments"]], [self.first.id, self.second.id]
+        )
+
+
+class CreateIfAbsentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="fan")
+        author = User.objects.create(username="author")
+        self.post = Post.objects.create(author=author, content="hello")
+
+    def test_only_the_first_like_is_created(self):
+        self.assertTrue(PostLike.objects.create_if_absent(self.user, self.post.pk))
+        self.assertFalse(PostLike.objects.create_if_absent(self.user, self.post.pk))
+
+        like = PostLike.objects.get()
+        self.assertEqual((like.user_id, like.post_id), (self.user.pk, self.post.pk))
+        self.assertIsNotNone(like.created_at)
+
+    def test_likes_are_per_user(self):
+        other = User.objects.create(username="other")
+        self.assertTrue(PostLike.objects.create_if_absent(self.user, self.post.pk))
+        self.assertTrue(PostLike.objects.create_if_absent(other, self.post.pk))
+        self.assertEqual(PostLike.objects.count(), 2)
+
+
+# The queue and like tests rely on foreign keys being checked at commit, so
+# they use TransactionTestCase rather than TestCase's wrapping transaction.
+
+
+class KarmaQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create(username="author")
+        self.post = Post.objects.create(author=self.author, content="hello")
+        # Long interval: the tests flush by hand, never the worker thread
+        self.queue = KarmaQueue(flush_interval=3600)
+
+    def karma(self, **kwargs):
+        fields = {
+            "user_id": self.author.pk,
+            "amount": 5,
+            "reason": KarmaTransaction.POST_LIKE,
+            "post_id": self.post.pk,
+        }
+        fields.update(kwargs)
+        return KarmaTransaction(**fields)
+
+    def test_flush_writes_pending_rows(self):
+        cache.set(LEADERBOARD_CACHE_KEY, [])
+        self.queue.put(self.karma())
+        self.queue.put(self.karma(amount=1))
+
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(
+            sorted(KarmaTransaction.objects.values_list("amount", flat=True)),
+            [1, 5],
+        )
+        self.assertIsNone(cache.get(LEADERBOARD_CACHE_KEY))
+
+    def test_karma_outlives_a_deleted_target(self):
+        other = Post.objects.create(author=self.author, content="bye")
+        self.queue.put(self.karma(post_id=other.pk))
+        self.queue.put(self.karma(amount=1))
+        other.delete()
+
+        with self.assertLogs("community.karma", "WARNING"):
+            self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(
+            sorted(KarmaTransaction.objects.values_list("amount", "post_id")),
+            [(1, self.post.pk), (5, None)],
+        )
+
+    def test_row_of_a_deleted_user_is_dropped(self):
+        self.queue.put(self.karma(user_id=self.author.pk + 1000))
+        self.queue.put(self.karma())
+
+        with self.assertLogs("community.karma", "ERROR"):
+            self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(KarmaTransaction.objects.get().user_id, self.author.pk)
+        # Dropped, not retried
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_transient_errors_are_retried_a_bounded_number_of_times(self):
+        self.queue.max_attempts = 2
+        self.queue.put(self.karma())
+        failing = mock.patch.object(
+            KarmaTransaction.objects, "bulk_create", side_effect=OperationalError
+        )
+
+        with failing, self.assertLogs("community.karma", "WARNING"):
+            self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(len(self.queue._pending), 1)
+
+        with failing, self.assertLogs("community.karma", "ERROR"):
+            self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(len(self.queue._pending), 0)
+        self.assertFalse(KarmaTransaction.objects.exists())
+
+    def test_full_queue_flushes_in_the_caller(self):
+        self.queue.max_pending = 1
+        self.queue.put(self.karma())
+        with self.assertLogs("community.karma", "WARNING"):
+            self.queue.put(self.karma(amount=1))
+
+        self.assertEqual(KarmaTransaction.objects.get().amount, 5)
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(KarmaTransaction.objects.count(), 2)
+
+
+class RecordLikeTests(TransactionTestCase):
+    def setUp(self):
+        self.fan = User.objects.create(username="fan")
+        self.author = User.objects.create(username="author")
+        self.post = Post.objects.create(author=self.author, content="hello")
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.author, content="hi"
+        )
+        # Off PostgreSQL, karma goes through the queue; flush it by hand
+        self.queue = KarmaQueue(flush_interval=3600)
+        patcher = mock.patch("community.views.karma_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def like_post(self, post_id=None):
+        record_like(
+            PostLike,
+            self.fan,
+            self.post.pk if post_id is None else post_id,
+            5,
+            KarmaTransaction.POST_LIKE,
+        )
+        self.queue.flush()
+
+    def test_new_like(self):
+        self.like_post()
+
+        self.assertTrue(PostLike.objects.filter(user=self.fan, post=self.post).exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        karma = KarmaTransaction.objects.get()
+        self.assertEqual(
+            (karma.user_id, karma.amount, karma.reason, karma.post_id),
+            (self.author.pk, 5, KarmaTransaction.POST_LIKE, self.post.pk),
+        )
+
+    def test_repeat_like_is_a_no_op(self):
+        self.like_post()
+        self.like_post()
+
+        self.assertEqual(PostLike.objects.count(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(KarmaTransaction.objects.count(), 1)
+
+    def test_comment_like(self):
+        record_like(
+            CommentLike, self.fan, self.comment.pk, 1, KarmaTransaction.COMMENT_LIKE
+        )
+        self.queue.flush()
+
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 1)
+        karma = KarmaTransaction.objects.get()
+        self.assertEqual(
+            (karma.user_id, karma.amount, karma.comment_id),
+            (self.author.pk, 1, self.comment.pk),
+        )
+
+    def test_unknown_target_is_404(self):
+        with self.assertRaises(Http404):
+            self.like_post(self.post.pk + 1000)
+
+        self.assertFalse(PostLike.objects.exists())
+        self.assertFalse(KarmaTransaction.objects.exists())
+
+    def test_unknown_target_inside_atomic(self):
+        # The 404 must not leave a broken like behind for the outer COMMIT
+        with transaction.atomic():
+            with self.assertRaises(Http404):
+                self.like_post(self.post.pk + 1000)
+            self.like_post()
+        self.queue.flush()
+
+        self.assertEqual(PostLike.objects.get().post_id, self.post.pk)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(KarmaTransaction.objects.count(), 1)
+
+    def test_like_endpoint(self):
+        response = self.client.post(f"/api/posts/{self.post.pk}/like/")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(f"/api/posts/{self.post.pk + 1000}/like/")
+        self.assertEqual(response.status_code, 404)
+
+    @skipUnless(connection.vendor == "postgresql", "needs writable CTEs")
+    def test_create_with_karma(self):
+        self.assertTrue(
+            PostLike.objects.create_with_karma(
+                self.fan, self.post.pk, 5, KarmaTransaction.POST_LIKE
+            )
+        )
+        self.assertFalse(
+            PostLike.objects.create_with_karma(
+                self.fan, self.post.pk, 5, KarmaTransaction.POST_LIKE
+            )
+        )
+
+        with self.assertRaises(Post.DoesNotExist):
+            PostLike.objects.create_with_karma(
+                self.fan, self.post.pk + 1000, 5, KarmaTransaction.POST_LIKE
+            )
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        # Written by the same statement, not the queue
+        self.assertEqual(self.queue.flush(), 0)
+        karma = KarmaTransaction.objects.get()
+        self.assertEqual(
+            (karma.user_id, karma.amount, karma.post_id),
+            (self.author.pk, 5, self.post.pk),
+        )
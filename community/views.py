@@ -1,17 +1,28 @@
 from datetime import timedelta
 
+import orjson
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q, Sum
+from django.db.models import F, Sum
+from django.http import Http404, HttpResponse
 from django.utils import timezone
-from rest_framework import generics, status
+from rest_framework import generics, serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Comment, CommentLike, KarmaTransaction, Post, PostLike
+from .karma import LEADERBOARD_CACHE_KEY, LEADERBOARD_CACHE_TTL, karma_queue
+from .models import (
+    Comment,
+    CommentLike,
+    KarmaTransaction,
+    Post,
+    PostLike,
+    apply_content_snippet,
+    with_content_snippet,
+)
 from .serializers import (
     CommentSerializer,
-    LeaderboardEntrySerializer,
     PostSerializer,
     UserSerializer,
 )
@@ -27,52 +38,171 @@ def build_comment_tree(comments):
     This avoids N+1 by:
     - Fetching all comments for all posts in one query
     - Assigning children without additional DB hits
+
+    Returns `{post_id: [root comments]}`; every comment gets its children in
+    `_prefetched_replies`.
     """
-    by_post = {}
     by_id = {}
-
     for c in comments:
         c._prefetched_replies = []
         by_id[c.id] = c
-        by_post.setdefault(c.post_id, []).append(c)
 
+    # Single linking pass; bind the hot lookups to locals.
+    by_id_get = by_id.get
     roots_by_post = {}
-    for post_id, post_comments in by_post.items():
-        roots = []
-        for c in post_comments:
-            if c.parent_id:
-                parent = by_id.get(c.parent_id)
-                if parent is not None:
-                    parent._prefetched_replies.append(c)
+    roots_get = roots_by_post.get
+    for c in comments:
+        parent_id = c.parent_id
+        if parent_id:
+            parent = by_id_get(parent_id)
+            if parent is not None:
+                parent._prefetched_replies.append(c)
+        else:
+            roots = roots_get(c.post_id)
+            if roots is None:
+                roots_by_post[c.post_id] = [c]
             else:
                 roots.append(c)
-        roots_by_post[post_id] = roots
     return roots_by_post
 
 
-class PostListCreateView(generics.ListCreateAPIView):
-    queryset = (
-        Post.objects.all()
-        .select_related("author")
-        .annotate(like_count=Count("likes"))
+def json_response(data):
+    """
+    Render already-serialized data with orjson.
+
+    Skips DRF's content negotiation and JSONRenderer on hot read endpoints;
+    the output matches DRF's JSON (UTC datetimes with a trailing "Z").
+    """
+    return HttpResponse(
+        orjson.dumps(data, option=orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC),
+        content_type="application/json",
     )
+
+
+def build_user_map(*groups):
+    """
+    Serialize each distinct author of the given posts/comments once.
+
+    Authors are already loaded via select_related, so this needs no query.
+    """
+    user_map = {}
+    for objs in groups:
+        for obj in objs:
+            if obj.author_id not in user_map:
+                user_map[obj.author_id] = UserSerializer(obj.author).data
+    return user_map
+
+
+def related_lookups(serializer, prefix=""):
+    """
+    Work out `(select_related, prefetch_related)` lookups from the relations
+    a serializer's readable fields traverse.
+
+    Nested serializers become select_related (recursing into their fields),
+    `many=True` ones prefetch_related, and custom fields opt in with a
+    `select_related = True` attribute. `source="*"` fields are skipped.
+    """
+    selects, prefetches = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+        path = prefix + "__".join(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            prefetches.append(path)
+        elif isinstance(field, serializers.BaseSerializer):
+            selects.append(path)
+            nested_selects, nested_prefetches = related_lookups(field, path + "__")
+            selects += nested_selects
+            prefetches += nested_prefetches
+        elif getattr(field, "select_related", False):
+            selects.append(path)
+    return selects, prefetches
+
+
+class AutoRelatedMixin:
+    """
+    Apply the serializer's related lookups (see related_lookups) to the
+    view's queryset, computed once per serializer class.
+    """
+
+    _related_lookups = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selects, prefetches = self.get_related_lookups()
+        if selects:
+            queryset = queryset.select_related(*selects)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    def get_related_lookups(self):
+        serializer_class = self.get_serializer_class()
+        lookups = self._related_lookups.get(serializer_class)
+        if lookups is None:
+            lookups = self._related_lookups[serializer_class] = related_lookups(
+                serializer_class()
+            )
+        return lookups
+
+
+class PostListCreateView(AutoRelatedMixin, generics.ListCreateAPIView):
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
+    # Bounds on each post's comments in the feed (see feed_for_posts); posts
+    # with more set `has_more_comments`, and the detail view has them all.
+    comment_roots_per_post = 50
+    comments_per_post = 500
+
+    def list(self, request, *args, **kwargs):
+        # Evaluate the (paginated) posts once and reuse them when building the
+        # serializer context, instead of re-running the Post query there.
+        queryset = self.filter_queryset(self.get_queryset())
+        self._truncate = truncate = self.get_truncate()
+        if truncate is not None:
+            queryset = with_content_snippet(queryset, truncate)
+        page = self.paginate_queryset(queryset)
+        self._page_posts = list(page if page is not None else queryset)
+        if truncate is not None:
+            apply_content_snippet(self._page_posts)
+
+        serializer = self.get_serializer(self._page_posts, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return json_response(serializer.to_representation(self._page_posts))
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        # Prefetch all comments for the posts in this page
-        posts = list(self.get_queryset())
+        posts = getattr(self, "_page_posts", None)
+        if posts is None:
+            # Not listing (e.g. create): a new post has no comments
+            return context
+        # Prefetch all comments for the posts in this page only
         post_ids = [p.id for p in posts]
-        comments = (
-            Comment.objects.filter(post_id__in=post_ids)
-            .select_related("author", "post", "parent")
-            .annotate(like_count=Count("likes"))
-            .order_by("created_at")
+        comments, with_more = Comment.objects.feed_for_posts(
+            post_ids,
+            self.comment_roots_per_post,
+            self.comments_per_post,
+            truncate=self._truncate,
         )
-        comment_tree = build_comment_tree(comments)
-        context["comment_tree"] = comment_tree
+        context["comment_tree"] = build_comment_tree(comments)
+        context["posts_with_more_comments"] = with_more
+        context["user_map"] = build_user_map(posts, comments)
         return context
 
+    def get_truncate(self):
+        """
+        Optional `?truncate=N`: only the first N characters of each post's
+        and comment's content are fetched and returned.
+        """
+        value = self.request.query_params.get("truncate")
+        if value is None:
+            return None
+        try:
+            return serializers.IntegerField(min_value=1).run_validation(value)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({"truncate": exc.detail})
+
     def perform_create(self, serializer):
         # In a real app, use request.user; for prototype allow anonymous via username param
         user = self.request.user if self.request.user.is_authenticated else None
@@ -82,25 +212,16 @@ class PostListCreateView(generics.ListCreateAPIView):
         serializer.save(author=user)
 
 
-class PostDetailView(generics.RetrieveAPIView):
-    queryset = (
-        Post.objects.all()
-        .select_related("author")
-        .annotate(like_count=Count("likes"))
-    )
+class PostDetailView(AutoRelatedMixin, generics.RetrieveAPIView):
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         post = self.get_object()
-        comments = (
-            Comment.objects.filter(post=post)
-            .select_related("author", "post", "parent")
-            .annotate(like_count=Count("likes"))
-            .order_by("created_at")
-        )
-        comment_tree = build_comment_tree(comments)
-        context["comment_tree"] = comment_tree
+        comments = Comment.objects.tree_for_posts([post.id])
+        context["comment_tree"] = build_comment_tree(comments)
+        context["user_map"] = build_user_map([post], comments)
         return context
 
 
@@ -115,27 +236,64 @@ class CommentCreateView(generics.CreateAPIView):
         serializer.save(author=user, post=post)
 
 
+def record_like(like_model, user, target_id, amount, reason):
+    """
+    Idempotently record `user`'s like of the Post/Comment `target_id`.
+
+    Only a new like bumps the target's `like_count` and credits `amount`
+    karma to its author. The target is never loaded up front; an unknown id
+    raises Http404 from within the like's own statement or savepoint, so it
+    also works inside an enclosing atomic().
+    """
+    manager = like_model.objects
+    target_field = manager.target_field
+    target_model = like_model._meta.get_field(target_field).related_model
+    target_lookup = {f"{target_field}_id": target_id}
+    not_found = Http404(
+        f"No {target_model._meta.object_name} matches the given query."
+    )
+
+    if manager.supports_writable_cte():
+        # Like, like_count and karma in a single statement
+        try:
+            created = manager.create_with_karma(user, target_id, amount, reason)
+        except target_model.DoesNotExist:
+            raise not_found
+        if created:
+            cache.delete(LEADERBOARD_CACHE_KEY)
+        return
+
+    # Repeat likes are the common case: answer them with one index lookup,
+    # without opening a transaction.
+    if manager.filter(user=user, **target_lookup).exists():
+        return
+
+    with transaction.atomic():
+        if not manager.create_if_absent(user, target_id):
+            return
+        targets = target_model.objects.filter(pk=target_id)
+        author_id = targets.values_list("author_id", flat=True).first()
+        if author_id is None:
+            # Raising rolls back the like row before its FK is checked
+            raise not_found
+        targets.update(like_count=F("like_count") + 1)
+        karma = KarmaTransaction(
+            user_id=author_id, amount=amount, reason=reason, **target_lookup
+        )
+        transaction.on_commit(lambda: karma_queue.put(karma))
+
+
 class PostLikeView(APIView):
     """
-    Idempotent like endpoint with race-safe get_or_create.
+    Idempotent like endpoint; a repeated like is a no-op at the database
+    level (INSERT ... ON CONFLICT DO NOTHING).
     """
 
     def post(self, request, pk):
         user = request.user if request.user.is_authenticated else None
         if user is None:
             user, _ = User.objects.get_or_create(username="demo")
-        post = generics.get_object_or_404(Post, pk=pk)
-
-        with transaction.atomic():
-            like, created = PostLike.objects.get_or_create(user=user, post=post)
-            if created:
-                KarmaTransaction.objects.create(
-                    user=post.author,
-                    amount=5,
-                    reason=KarmaTransaction.POST_LIKE,
-                    post=post,
-                )
-
+        record_like(PostLike, user, pk, 5, KarmaTransaction.POST_LIKE)
         return Response({"liked": True}, status=status.HTTP_200_OK)
 
 
@@ -144,45 +302,48 @@ class CommentLikeView(APIView):
         user = request.user if request.user.is_authenticated else None
         if user is None:
             user, _ = User.objects.get_or_create(username="demo")
-        comment = generics.get_object_or_404(Comment, pk=pk)
+        record_like(CommentLike, user, pk, 1, KarmaTransaction.COMMENT_LIKE)
+        return Response({"liked": True}, status=status.HTTP_200_OK)
 
-        with transaction.atomic():
-            like, created = CommentLike.objects.get_or_create(
-                user=user, comment=comment
-            )
-            if created:
-                KarmaTransaction.objects.create(
-                    user=comment.author,
-                    amount=1,
-                    reason=KarmaTransaction.COMMENT_LIKE,
-                    comment=comment,
-                )
 
-        return Response({"liked": True}, status=status.HTTP_200_OK)
+def compute_leaderboard():
+    """
+    Top 5 users by karma earned in the last 24 hours, as response-ready dicts.
+    """
+    since = timezone.now() - timedelta(hours=24)
+
+    # Narrow first: aggregate the 24h window on the ledger alone, then
+    # look up just the winning users.
+    top = list(
+        KarmaTransaction.objects.filter(created_at__gte=since)
+        .values("user_id")
+        .annotate(karma_24h=Sum("amount"))
+        .order_by("-karma_24h")[:5]
+    )
+    users = User.objects.in_bulk([row["user_id"] for row in top])
+
+    return [
+        {
+            "user": {
+                "id": row["user_id"],
+                "username": users[row["user_id"]].username,
+            },
+            "karma_24h": row["karma_24h"] or 0,
+        }
+        for row in top
+    ]
 
 
 class LeaderboardView(APIView):
     """
     Return top 5 users by karma earned in the last 24 hours.
+
+    The result is the same for every viewer, so it is cached for
+    LEADERBOARD_CACHE_TTL seconds and dropped whenever karma is recorded.
     """
 
     def get(self, request):
-        now = timezone.now()
-        since = now - timedelta(hours=24)
-
-        users = (
-            User.objects.filter(karma_transactions__created_at__gte=since)
-            .annotate(
-                karma_24h=Sum(
-                    "karma_transactions__amount",
-                    filter=Q(karma_transactions__created_at__gte=since),
-                )
-            )
-            .order_by("-karma_24h")[:5]
+        entries = cache.get_or_set(
+            LEADERBOARD_CACHE_KEY, compute_leaderboard, LEADERBOARD_CACHE_TTL
         )
-
-        entries = [
-            {"user": user, "karma_24h": user.karma_24h or 0} for user in users
-        ]
-        serializer = LeaderboardEntrySerializer(entries, many=True)
-        return Response(serializer.data)
+        return json_response(entries)
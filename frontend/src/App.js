@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import "./index.css";
 
 // Default to local dev API, but allow overriding in deployments (e.g. Vercel)
@@ -138,6 +138,13 @@ function App() {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [newPost, setNewPost] = useState("");
+  // Posts whose full comment list the user asked for
+  const expandedPosts = useRef(new Set());
+
+  const fetchPost = async (id) => {
+    const res = await fetch(`${API_BASE}/posts/${id}/`);
+    return res.json();
+  };
 
   const loadPosts = async () => {
     setLoading(true);
@@ -145,8 +152,17 @@ function App() {
       const res = await fetch(`${API_BASE}/posts/`);
       const data = await res.json();
       // Comments are already returned as a fully nested tree by the backend
-      // serializers, so we can use them directly.
-      setPosts(data);
+      // serializers, so we can use them directly. The feed only carries the
+      // first threads of busy posts; keep expanded posts complete.
+      setPosts(
+        await Promise.all(
+          data.map((post) =>
+            post.has_more_comments && expandedPosts.current.has(post.id)
+              ? fetchPost(post.id)
+              : post
+          )
+        )
+      );
     } catch (e) {
       console.error("Failed to load posts", e);
     } finally {
@@ -158,6 +174,16 @@ function App() {
     loadPosts();
   }, []);
 
+  const showAllComments = async (id) => {
+    try {
+      const post = await fetchPost(id);
+      expandedPosts.current.add(id);
+      setPosts((prev) => prev.map((p) => (p.id === id ? post : p)));
+    } catch (e) {
+      console.error("Failed to load comments", e);
+    }
+  };
+
   const handleCreatePost = async (e) => {
     e.preventDefault();
     if (!newPost.trim()) return;
@@ -324,6 +350,15 @@ function App() {
                       )}
                     </div>
 
+                    {post.has_more_comments && (
+                      <button
+                        onClick={() => showAllComments(post.id)}
+                        className="mt-2 text-xs text-sky-300 hover:text-sky-200"
+                      >
+                        Show all comments
+                      </button>
+                    )}
+
                     <div className="mt-3">
                       <InlineCommentForm
                         onSubmit={(text) => addComment(post.id, null, text)}